@@ -1,9 +1,15 @@
 # Importando as bibliotecas necessárias
 import streamlit as st
 import google.generativeai as genai
-from googleapiclient.discovery import build
+import httpx
+import asyncio
+import functools
 import os
 import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote_plus
 
 # --- Carregamento das Chaves de API ---
 # Use o sistema de segredos do Streamlit ou variáveis de ambiente
@@ -23,86 +29,281 @@ if not GEMINI_API_KEY or not YOUTUBE_API_KEY:
     st.error("ERRO: As chaves de API do Gemini e do YouTube não foram encontradas. Defina-as em suas variáveis de ambiente ou segredos do Streamlit.")
     st.stop() # Interrompe a execução do app se as chaves não existirem
 
+# --- Instruções fixas do "Music Sommelier" ---
+# Ficam na system_instruction do modelo, separadas das preferências que o usuário envia a cada chamada
+MUSIC_SOMMELIER_RULES = """
+Você é um "Music Sommelier", um especialista em curadoria musical de nicho, focado em conectar músicas com base em nuances e características sonoras específicas. Sua tarefa é criar uma playlist coesa e de alta qualidade.
+
+O usuário enviará as preferências dele na mensagem, no formato: Preferências: "..."
+
+Siga estas regras RIGOROSAMENTE:
+
+1.  **Inclusão Obrigatória:** Se o usuário mencionou músicas ou artistas específicos, comece a playlist com eles. O restante da playlist deve complementar essas escolhas iniciais.
+2.  **Critérios de Seleção:** As músicas recomendadas DEVEM compartilhar características sonoras claras com as preferências do usuário. Concentre-se em:
+    - **Subgênero:** Mantenha-se estritamente dentro do subgênero (ex: se for 'grunge', evite 'hard rock de arena').
+    - **Instrumentação e Timbre:** Procure por timbres de guitarra, padrões de bateria ou linhas de baixo semelhantes.
+    - **Período de Tempo:** Dê preferência a músicas da mesma era ou de movimentos musicais diretamente influenciados.
+    - **"Vibe" e Atmosfera:** A energia e o sentimento da música devem ser compatíveis.
+3.  **Evitar Saltos Genéricos:** Não recomende artistas muito óbvios ou de gêneros completamente diferentes, a menos que haja uma conexão muito forte e específica.
+4.  **Formato de Saída:** A sua resposta final deve conter APENAS a lista de músicas. Para cada música, use o formato exato "Nome da Música | Nome do Artista", uma por linha. Não adicione números, marcadores, títulos, explicações ou qualquer texto introdutório. A playlist final deve ter um total de 8 a 10 músicas.
+"""
+
 # --- Configuração das APIs ---
-try:
+# Uma lista de 10 linhas é tarefa leve: o flash-lite responde mais rápido e mais barato.
+# O flash completo fica disponível no "Modo premium"
+DEFAULT_MODEL = 'gemini-2.5-flash-lite'
+PREMIUM_MODEL = 'gemini-2.5-flash'
+
+# 10 linhas × ~15 tokens ≈ 150 tokens; o limite evita respostas longas e o parser ignora
+# qualquer linha fora do formato "Música | Artista".
+# O gemini-2.5-flash "pensa" antes de responder e esses tokens também contam no limite:
+# com só 250 ele pode gastar tudo pensando e terminar sem nenhuma música
+MAX_OUTPUT_TOKENS = {DEFAULT_MODEL: 250, PREMIUM_MODEL: 8192}
+
+@st.cache_resource
+def _gemini_model(model_name):
+    """Configura o Gemini uma única vez por processo (e por modelo), e não a cada rerun do script."""
     genai.configure(api_key=GEMINI_API_KEY)
-    youtube = build('youtube', 'v3', developerKey=YOUTUBE_API_KEY)
-    model = genai.GenerativeModel('gemini-1.5-flash-latest')
+    generation_config = genai.types.GenerationConfig(
+        max_output_tokens=MAX_OUTPUT_TOKENS[model_name],
+        temperature=0.8,
+        candidate_count=1,
+    )
+    return genai.GenerativeModel(
+        model_name,
+        system_instruction=MUSIC_SOMMELIER_RULES,
+        generation_config=generation_config,
+    )
+
+try:
+    # O valor do toggle da barra lateral já está no session_state quando o script roda de novo
+    model = _gemini_model(PREMIUM_MODEL if st.session_state.get("premium_mode", False) else DEFAULT_MODEL)
 except Exception as e:
     st.error(f"Erro ao configurar as APIs: {e}")
     st.stop()
 
 
 # --- Funções Auxiliares (do script anterior) ---
-def get_youtube_video_id(song_title, artist):
-    query = f"{song_title} {artist} official audio"
+# Compilada uma única vez; uma só passada pelo texto extrai todos os pares "Música | Artista",
+# já sem espaços nas pontas. Só [ \t] (nunca \s) para que um par não atravesse duas linhas
+_PAIRS_RE = re.compile(r"(?m)^[ \t]*([^|\n]+?)[ \t]*\|[ \t]*([^\n]+?)[ \t]*\r?$")
+# Links do YouTube já trazem o ID do vídeo; nesses casos a busca é desnecessária
+_YOUTUBE_URL_RE = re.compile(r"^(?:https?://)?(?:www\.|m\.|music\.)?(?:youtube\.com/watch\?(?:\S*?&)?v=|youtu\.be/)([A-Za-z0-9_-]{11})")
+
+class _TTLCache:
+    """Dicionário com expiração, seguro para as várias sessões (threads) do servidor."""
+
+    def __init__(self, ttl, max_entries=None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            stored_at, value = item
+            if time.monotonic() - stored_at > self.ttl:
+                del self._data[key]
+                return None
+            # Move o item para o fim: quem é lido com frequência fica longe da remoção (LRU)
+            self._data[key] = self._data.pop(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = (time.monotonic(), value)
+            # O dict mantém a ordem de uso: o primeiro item é o usado há mais tempo
+            if self.max_entries and len(self._data) > self.max_entries:
+                del self._data[next(iter(self._data))]
+
+@st.cache_resource
+def _recommendations_cache():
+    # cache_resource mantém a mesma instância entre reruns e entre sessões;
+    # a chave é texto livre do usuário, então o tamanho também é limitado
+    return _TTLCache(ttl=3600, max_entries=1000)
+
+@st.cache_resource
+def _video_id_cache():
+    # Músicas populares se repetem entre sessões; guarda os IDs por 1 dia
+    return _TTLCache(ttl=86400, max_entries=10000)
+
+@st.cache_resource
+def _youtube_http():
+    """Cliente HTTP/2 persistente: todas as buscas compartilham uma única conexão TLS."""
+    client = httpx.Client(
+        http2=True,
+        base_url="https://www.googleapis.com/youtube/v3",
+        timeout=10,
+        headers={"X-Goog-Api-Key": YOUTUBE_API_KEY},
+    )
+    # Aquece DNS + TLS em segundo plano: a primeira busca real já encontra a conexão aberta no pool
+    threading.Thread(target=_warm_up_connection, args=(client,), daemon=True).start()
+    return client
+
+def _warm_up_connection(client):
     try:
-        search_response = youtube.search().list(q=query, part='snippet', maxResults=1, type='video').execute()
-        if search_response.get("items"):
-            return search_response["items"][0]["id"]["videoId"]
-    except Exception:
-        # Silenciosamente falha para não poluir a interface com erros
-        return None
+        client.get("https://www.googleapis.com/generate_204", timeout=3)
+    except httpx.HTTPError:
+        # É só uma otimização; se falhar, a primeira busca abre a conexão normalmente
+        pass
+
+def _stream_pair_batches(user_input):
+    """Devolve, a cada chunk do Gemini, a lista de pares (música, artista) das linhas que ele completou."""
+    response = model.generate_content(f'Preferências: "{user_input}"', stream=True)
+    buffer = ""
+    for chunk in response:
+        try:
+            buffer += chunk.text
+        except ValueError:
+            # Chunk sem texto (ex: só o motivo de término); não há nada para analisar
+            continue
+        # Só o trecho até a última quebra de linha está completo; o resto espera o próximo chunk
+        complete, _, buffer = buffer.rpartition('\n')
+        batch = [match.groups() for match in _PAIRS_RE.finditer(complete)]
+        if batch:
+            yield batch
+    batch = [match.groups() for match in _PAIRS_RE.finditer(buffer)]
+    if batch:
+        yield batch
+
+async def _stream_recommendations(user_input):
+    """Produz lotes de pares (música, artista) conforme o Gemini gera cada chunk.
+
+    Entradas repetidas vêm do cache por 1 hora, sem chamar o Gemini.
+    """
+    cache = _recommendations_cache()
+    # Cada modelo gera recomendações diferentes, então o modelo faz parte da chave
+    cache_key = (model.model_name, user_input)
+    cached = cache.get(cache_key)
+    if cached is not None:
+        yield cached
+        return
+
+    pairs = []
+    seen = set()
+    stream = _stream_pair_batches(user_input)
+    # O stream do Gemini é bloqueante: cada chunk é lido numa thread para as buscas seguirem rodando
+    while (batch := await asyncio.to_thread(next, stream, None)) is not None:
+        new_pairs = []
+        for pair in batch:
+            # O Gemini às vezes repete músicas; cada repetição custaria uma busca no YouTube
+            key = (pair[0].lower(), pair[1].lower())
+            if key in seen:
+                continue
+            seen.add(key)
+            new_pairs.append(pair)
+        if new_pairs:
+            pairs.extend(new_pairs)
+            yield new_pairs
+    # Uma resposta sem nenhuma música válida não vai para o cache: a próxima tentativa chama o Gemini de novo
+    if pairs:
+        cache.set(cache_key, pairs)
+
+async def _fetch_id(song_title, artist, executor):
+    """Busca o ID do vídeo no YouTube usando a API REST diretamente."""
+    url_match = _YOUTUBE_URL_RE.match(song_title)
+    if url_match:
+        return url_match.group(1)
+
+    cache = _video_id_cache()
+    cache_key = (song_title.strip().lower(), artist.strip().lower())
+    video_id = cache.get(cache_key)
+    if video_id is not None:
+        return video_id
+
+    query = f"{song_title} {artist} official audio"
+    # part=id e fields limitam a resposta ao único campo usado (o videoId)
+    params = {"q": query, "part": "id", "maxResults": 1, "type": "video", "fields": "items/id/videoId"}
+    # O httpx.Client é síncrono e thread-safe; cada busca roda numa thread do pool e o HTTP/2 multiplexa todas
+    search = functools.partial(_youtube_http().get, "/search", params=params)
+    search_response = await asyncio.get_running_loop().run_in_executor(executor, search)
+    search_response.raise_for_status()
+    items = search_response.json().get("items")
+    if items:
+        video_id = items[0]["id"]["videoId"]
+        cache.set(cache_key, video_id)
+        return video_id
     return None
 
-def generate_playlist(user_input):
-    """Função principal que interage com a IA e o YouTube."""
-    prompt_completo = f"""
-    Você é um "Music Sommelier", um especialista em curadoria musical de nicho, focado em conectar músicas com base em nuances e características sonoras específicas. Sua tarefa é criar uma playlist coesa e de alta qualidade.
+async def _find_video_ids(user_input):
+    """Dispara a busca de cada música no YouTube assim que ela chega do Gemini.
 
-    O usuário forneceu as seguintes preferências: "{user_input}"
-    
-    Siga estas regras RIGOROSAMENTE:
-    
-    1.  **Inclusão Obrigatória:** Se o usuário mencionou músicas ou artistas específicos, comece a playlist com eles. O restante da playlist deve complementar essas escolhas iniciais.
-    2.  **Critérios de Seleção:** As músicas recomendadas DEVEM compartilhar características sonoras claras com as preferências do usuário. Concentre-se em:
-        - **Subgênero:** Mantenha-se estritamente dentro do subgênero (ex: se for 'grunge', evite 'hard rock de arena').
-        - **Instrumentação e Timbre:** Procure por timbres de guitarra, padrões de bateria ou linhas de baixo semelhantes.
-        - **Período de Tempo:** Dê preferência a músicas da mesma era ou de movimentos musicais diretamente influenciados.
-        - **"Vibe" e Atmosfera:** A energia e o sentimento da música devem ser compatíveis.
-    3.  **Evitar Saltos Genéricos:** Não recomende artistas muito óbvios ou de gêneros completamente diferentes, a menos que haja uma conexão muito forte e específica.
-    4.  **Formato de Saída:** A sua resposta final deve conter APENAS a lista de músicas. Para cada música, use o formato exato "Nome da Música | Nome do Artista", uma por linha. Não adicione números, marcadores, títulos, explicações ou qualquer texto introdutório. A playlist final deve ter um total de 8 a 10 músicas.
+    O gather preserva a ordem em que as músicas foram recomendadas.
     """
-    
-    # Gerar recomendações com Gemini
-    response = model.generate_content(prompt_completo)
-    song_recommendations = response.text.strip().split('\n')
-    
-    video_ids = []
+    # Um pool por playlist, para que sessões simultâneas não disputem as mesmas threads.
+    # As threads são criadas sob demanda, então nunca passam do número de músicas (no máximo 10)
+    with ThreadPoolExecutor(max_workers=10, thread_name_prefix="youtube-search") as executor:
+        tasks = []
+        # Um único elemento para o progresso, redesenhado uma vez por chunk do Gemini (ou uma
+        # só vez quando a resposta vem do cache), em vez de um st.write por música
+        progress = st.empty()
+        progress_lines = []
+        async for batch in _stream_recommendations(user_input):
+            for song, artist in batch:
+                # Link provisório: o usuário já pode ouvir a faixa enquanto o ID exato é resolvido
+                search_url = f"https://music.youtube.com/search?q={quote_plus(f'{song} {artist}')}"
+                progress_lines.append(f"Buscando por '{song}' de '{artist}'... [ouvir agora]({search_url})")
+                tasks.append(asyncio.create_task(_fetch_id(song, artist, executor)))
+            progress.markdown("\n\n".join(progress_lines))
+        # return_exceptions=True: uma busca com erro não derruba as outras
+        return await asyncio.gather(*tasks, return_exceptions=True)
+
+def _create_playlist_url(user_input):
+    """Gera as recomendações, busca os vídeos e monta a URL da playlist (ou None)."""
     # Usando st.status para mostrar o progresso na interface
     with st.status("Encontrando as músicas no YouTube...", expanded=True) as status:
-        for line in song_recommendations:
-            match = re.match(r"(.+?)\s*\|\s*(.+)", line)
-            if match:
-                song, artist = match.groups()
-                song, artist = song.strip(), artist.strip()
-                st.write(f"Buscando por '{song}' de '{artist}'...")
-                video_id = get_youtube_video_id(song, artist)
-                if video_id:
-                    video_ids.append(video_id)
+        results = asyncio.run(_find_video_ids(user_input))
+        # Silenciosamente ignora falhas para não poluir a interface com erros
+        video_ids = [video_id for video_id in results if isinstance(video_id, str)]
         
         if video_ids:
             status.update(label="Playlist criada com sucesso!", state="complete", expanded=False)
     
     if video_ids:
         playlist_ids_string = ",".join(video_ids)
-        playlist_url = f"https://www.youtube.com/watch_videos?video_ids={playlist_ids_string}"
+        return f"https://www.youtube.com/watch_videos?video_ids={playlist_ids_string}"
+    return None
+
+def generate_playlist(user_input):
+    """Função principal que interage com a IA e o YouTube."""
+    # Normaliza a entrada para que variações de caixa e espaços reaproveitem o cache
+    user_input = user_input.strip().lower()
+    cache_key = (model.model_name, user_input)
+    playlist_url = st.session_state.playlist_cache.get(cache_key)
+    if playlist_url is None:
+        playlist_url = _create_playlist_url(user_input)
+        if playlist_url:
+            st.session_state.playlist_cache[cache_key] = playlist_url
+
+    if playlist_url:
         return f"Playlist pronta! 🎧\n\n[Clique aqui para ouvir no YouTube]({playlist_url})"
     else:
         return "Desculpe, não consegui encontrar vídeos para as músicas recomendadas. Tente ser mais específico."
 
 
+# Cria o cliente do YouTube já no carregamento, para a conexão aquecer enquanto o usuário digita
+_youtube_http()
+
+
 # --- Interface do Streamlit ---
 
 # Título da página
 st.set_page_config(page_title="Playlisto", page_icon="🎵")
 st.title("Calma aí, playlisto 👐")
 st.caption("Um chatbot para criar playlists no YouTube com base no seu gosto musical.")
+st.sidebar.toggle("Modo premium", key="premium_mode", help="Usa o Gemini 2.5 Flash completo: um pouco mais lento, mas com recomendações mais refinadas.")
 
 # Inicializar o histórico do chat na memória da sessão
 if "messages" not in st.session_state:
     st.session_state.messages = [{"role": "assistant", "content": "Olá! Descreva as bandas, músicas ou o estilo que você curte e eu criarei uma playlist para você."}]
 
+# URLs de playlists já geradas nesta sessão, por modelo e entrada normalizada
+st.session_state.setdefault("playlist_cache", {})
+
 # Exibir mensagens do histórico
 for message in st.session_state.messages:
     with st.chat_message(message["role"]):